@@ -1,119 +1,687 @@
 #!/usr/bin/python3
 
+import asyncio
+import collections
+import functools
+import os
+import re
+import selectors
 import serial
+import threading
 import time
+import weakref
+
+
+# One status line, see _parseState
+_LINE_RE = re.compile(rb'S\d+L[1-4](?:,[01]){4}')
+
+
+def _parseState(lines):
+    """Parse the 4 status lines from the SS 4.4 into a single integer, with one
+    bit for each input/output crosspoint (see isConnected).  Raises IOError
+    if they don't give the state of every output"""
+    # Output lines look like:
+    # S0L1,0,1,0,0
+    # S0L2,0,0,0,1
+    # S0L3,0,0,0,1
+    # S0L4,0,0,0,1
+    # Where S means status, 0 is the unit number, L1, L2, L3, L4 are the
+    # outputs, and then the next 4 0's and 1's represent which input is
+    # connected to the output.  Find each raw line with _LINE_RE rather than
+    # decoding and splitting on the comma's.  The match doesn't care about
+    # line noise in front of the S, or how many digits the unit number has.
+    # From the end of the match everything is at a fixed position, so pick
+    # the digits straight out of the bytes.  ASCII '0' and '1' only differ
+    # in the low bit.
+    # Lines that don't match are skipped, but we have to have seen all 4
+    # outputs, or we'd be guessing at the rest.
+    state = 0
+    seen = 0
+    for line in lines:
+        m = _LINE_RE.search(line)
+        if m is None:
+            continue        # garbage
+        end = m.end()
+        o = line[end - 9] - 0x30
+        bits = ((line[end - 7] & 1) | (line[end - 5] & 1) << 1 |
+                (line[end - 3] & 1) << 2 | (line[end - 1] & 1) << 3)
+        state |= bits << ((o - 1) * 4)
+        seen |= 1 << (o - 1)
+
+    if seen != 0xF:
+        raise IOError('incomplete status output from the switcher')
+
+    return state
+
+
+# Use the compiled parser if it's been built (see _ss44parse.pyx).  Keep the
+# Python one around to check it against.
+_pyParseState = _parseState
+try:
+    from _ss44parse import parse_state as _parseState
+except ImportError:
+    pass
+
+
+def _bit(ii, o):
+    """The bit for input ii on output o in a parsed state.  Each output gets a
+    4 bit nibble, output 1 in the lowest"""
+    return 1 << ((o - 1) * 4 + ii - 1)
+
+
+def isConnected(state, ii, o):
+    """Returns True if input ii is connected to output o in state, as returned
+    by readState()"""
+    return bool(state & _bit(ii, o))
+
+
+def _outputMask(o):
+    """All the bits for output o in a parsed state"""
+    return 0xF << ((o - 1) * 4)
+
+
+def crosspoints(state):
+    """List the (input, output) pairs that are connected in state.  XOR two
+    states to find what changed between them: crosspoints(new ^ old)"""
+    points = []
+    while state:
+        low = state & -state    # lowest set bit
+        bit = low.bit_length() - 1
+        points.append((bit % 4 + 1, bit // 4 + 1))
+        state ^= low
+
+    return points
+
+
+def _checkCrosspoint(ii, o):
+    """Raise ValueError unless input ii and output o are both 1-4"""
+    if ii not in range(1, 5) or o not in range(1, 5):
+        raise ValueError(f'no such crosspoint, input {ii} output {o}, '
+                         'inputs and outputs are 1-4')
+
+
+def _otherInputs(state, ii, o):
+    """List the inputs other than ii that are connected to output o"""
+    return [i for i, x in crosspoints(state & _outputMask(o) & ~_bit(ii, o))]
+
+
+def _check(results, expected, mask=0xFFFF):
+    """Raise IOError if results isn't the state we expected, only looking at
+    the crosspoints in mask"""
+    for ii, o in crosspoints((results ^ expected) & mask):
+        if isConnected(expected, ii, o):
+            raise IOError(f'failed to connect input {ii} to output {o}')
+        raise IOError(f'failed to mute input {ii} on output {o}')
+
+
+def _commands(u):
+    """Build all the commands for unit u up front, as bytes ready to write to
+    the serial port.  Inputs and outputs are both 1-4, so there are only 16
+    connects and 16 mutes.  The protocol is plain ASCII"""
+    muteAll = f'*{u}MA'.encode('ascii')
+    status = f'*{u}SL'.encode('ascii')
+    connect = {(ii, o): f'*{u}{ii:02d}{o}'.encode('ascii')
+               for ii in range(1, 5) for o in range(1, 5)}
+    mute = {(ii, o): f'*{u}{ii:02d}M{o}'.encode('ascii')
+            for ii in range(1, 5) for o in range(1, 5)}
+    return muteAll, status, connect, mute
+
+
+def _locked(method):
+    """Decorator for SS44 methods that use the serial port, so only one thread
+    at a time does.  Otherwise they'd read each other's status outputs"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class _ReaderThread(threading.Thread):
+    """Keeps draining the serial port into a buffer in the background, so
+    nothing gets lost while the main thread is busy doing something else,
+    and readers just wait on the buffer.  The buffer is bounded, if nobody
+    reads it we only keep the newest SIZE bytes.  The thread only holds a
+    weak reference to the read method's owner, and stops once it's gone, so
+    an SS44 that's dropped without close() still gets cleaned up."""
+
+    SIZE = 4096     # about 4 seconds of serial data at 9600 baud
+
+
+    def __init__(self, read):
+        """read is a bound method, called over and over to get whatever bytes
+        have arrived, it should give up after a short while if there aren't
+        any"""
+        super().__init__(daemon=True)
+        self.read = weakref.WeakMethod(read)
+        self.buf = bytearray()
+        self.cond = threading.Condition()
+        self.error = None
+        self.waiting = 0        # how many readLines() calls are waiting
+        self._stopping = threading.Event()
+
+
+    def run(self):
+        while not self._stopping.is_set():
+            read = self.read()
+            if read is None:
+                # Our owner's been garbage collected
+                return
+            try:
+                chunk = read()
+            except (serial.SerialException, OSError) as e:
+                # The port's gone, let readLines() tell the reader
+                with self.cond:
+                    self.error = e
+                    self.cond.notify_all()
+                return
+            finally:
+                # Don't keep our owner alive while we wait for the lock
+                del read
+            if chunk:
+                with self.cond:
+                    self.buf += chunk
+                    # Only trim when nobody's reading.  A reader takes lines
+                    # out as they arrive, but can fall behind a fast burst,
+                    # and we mustn't lose lines it's waiting for.
+                    if len(self.buf) > self.SIZE and not self.waiting:
+                        del self.buf[:-self.SIZE]
+                    self.cond.notify_all()
+
+
+    def discard(self):
+        """Throw away everything received so far"""
+        with self.cond:
+            self.buf.clear()
+
+
+    def stop(self):
+        """Stop the thread, and wait for it to finish"""
+        self._stopping.set()
+        self.join()
+
+
+    def readLines(self, n, timeout, keep=None):
+        """Wait up to timeout seconds for n lines, and return the last keep of
+        them (all of them by default) as bytes.  Lines are taken out of the
+        buffer as they arrive, so n can be more than would fit in it.
+        Raises serial.SerialTimeoutException if they don't all turn up"""
+        lines = collections.deque(maxlen=keep or n)
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            buf = self.buf
+            while True:
+                # Anything after the n'th newline belongs to the next status
+                # output, so leave it in the buffer for next time.
+                end = buf.find(b'\n') + 1
+                while n and end:
+                    lines.append(bytes(buf[:end]))
+                    del buf[:end]
+                    n -= 1
+                    end = buf.find(b'\n') + 1
+                if not n:
+                    return list(lines)
+
+                if self.error is not None:
+                    raise self.error
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise serial.SerialTimeoutException(
+                        'timed out waiting for the status output from the '
+                        'switcher')
+                self.waiting += 1
+                try:
+                    self.cond.wait(remaining)
+                finally:
+                    self.waiting -= 1
+
 
 class SS44:
     """This class is for the control of the Broadcast Tools SS 4.4 Stereo
     Matrix Switcher"""
 
 
-    def __init__(self, port='/dev/ttyUSB0', baud=9600, unit=0):
-        """Initialize the serial port, and set the unit number (defaults to 0)"""
-        self.ser  = serial.Serial(port, baud, timeout=1)
+    def __init__(self, port='/dev/ttyUSB0', baud=9600, unit=0, timeout=1):
+        """Initialize the serial port, and set the unit number (defaults to 0).
+        timeout is how long to wait for a whole status output"""
+        # Keep the port timeout short, so the reader thread notices when it's
+        # time to stop.  _readLines() enforces the overall timeout itself.
+        self.ser  = serial.Serial(port, baud, timeout=0.05)
+        self._setLowLatency()
+        # On POSIX we can wait on the port's file descriptor ourselves (see
+        # _readSerial).  Windows ports don't have one (fileno() raises
+        # io.UnsupportedOperation), and select() there only works on sockets.
+        self._sel = None
+        if os.name == 'posix':
+            try:
+                fd = self.ser.fileno()
+            except (OSError, ValueError):
+                fd = None
+            if fd is not None:
+                self._sel = selectors.DefaultSelector()
+                self._sel.register(fd, selectors.EVENT_READ)
         self.u = unit
+        (self._cmdMuteAll, self._cmdStatus,
+         self._cmdConnect, self._cmdMute) = _commands(unit)
+        self.timeout = timeout
+        # See _locked.  Reentrant, as the methods call each other, and a batch
+        # holds it from startBatch() to finishBatch().
+        self._lock = threading.RLock()
+        self._batch = None
+        self._frames = 0
+        # Our copy of the switcher state, we don't know it until we've read
+        # a status output.
+        self._state = None
+        self._reader = _ReaderThread(self._readSerial)
+        self._reader.start()
+
+
+    def close(self):
+        """Stop reading and close the serial port.  That also happens when the
+        SS44 is garbage collected, but call this to have it happen now"""
+        self._reader.stop()
+        if self._sel is not None:
+            self._sel.close()
+        self.ser.close()
+
+
+    def _setLowLatency(self):
+        """Ask the kernel driver for low latency mode (ASYNC_LOW_LATENCY).
+        USB serial adapters like the FTDI otherwise hold received bytes for
+        their latency timer (16ms by default) before handing them over, which
+        dominates the time to read a status output at 9600 baud.  This only
+        exists on Linux (elsewhere pyserial raises NotImplementedError, or
+        doesn't have the method at all on Windows), and not every driver
+        supports it, so failing is fine."""
+        try:
+            self.ser.set_low_latency_mode(True)
+        except (AttributeError, NotImplementedError, ValueError):
+            pass
 
 
     def _writeSerial(self, c):
-        """Write the formatted command to the serial port, flushing after
-        write"""
-        self.ser.write(bytes(c.encode('utf-8')))
-        self.ser.flush()
-
-
+        """Write the command bytes to the serial port.  Inside a batch the
+        command is queued up instead.  There's no flush(), which would wait
+        a few ms per character at 9600 baud for the bytes to go out on the
+        wire.  We read the status output after every command anyway, and it
+        can't arrive before the command has gone out."""
+        if self._batch is not None:
+            self._batch += c
+            self._frames += 1
+            return
+        self.ser.write(c)
+
+
+    def _readSerial(self):
+        """Wait a little while for bytes to arrive on the serial port, and
+        return whatever's there (maybe nothing).  This runs in the reader
+        thread.  Where we can, select() on the port and read it directly, so
+        we wake up once per burst of bytes rather than going through
+        pyserial's read loop.  Otherwise block for the first byte and drain
+        whatever else is already waiting."""
+        if self._sel is None:
+            return self.ser.read(max(1, self.ser.in_waiting))
+        if not self._sel.select(self.ser.timeout):
+            return b''
+        chunk = os.read(self.ser.fileno(), 4096)
+        if not chunk:
+            # Same as pyserial, readable but nothing there means the port went
+            # away (USB adapter unplugged?)
+            raise serial.SerialException(
+                'device reports readiness to read but returned no data')
+        return chunk
+
+
+    def _readLines(self, n, keep=None):
+        """Read n lines from the serial port, and return the last keep of them
+        (all of them by default) as bytes.  The reader thread
+        does the actual reading, we wait until it has seen n newlines or we
+        run out of time, in which case serial.SerialTimeoutException is
+        raised."""
+        # Each status line is 14 characters, at 10 bit times per character.
+        timeout = self.timeout + n * 14 * 10 / self.ser.baudrate
+        return self._reader.readLines(n, timeout, keep)
+
+
+    def startBatch(self):
+        """Start queueing up commands instead of sending them one at a time.
+        The switcher is free to take commands back to back, so the whole batch
+        goes out in a single write when finishBatch() is called.  We can't
+        read the status while batching, so we go by our copy of the state,
+        reading it first if we don't have one yet.  Other threads wait until
+        the batch is finished, or their commands would end up in it."""
+        self._lock.acquire()
+        try:
+            if self._state is None:
+                self.getState()
+        except BaseException:
+            self._lock.release()
+            raise
+        self._batch = bytearray()
+        self._frames = 0
+
+
+    def finishBatch(self):
+        """Send all the queued commands in a single write.  Every command
+        makes the switcher print a status output, only the last one
+        matters, it's the state after the whole batch.  Returns that state"""
+        if self._batch is None:
+            return self._state
+        batch, frames = self._batch, self._frames
+        self._batch = None
+        try:
+            if not frames:
+                return self._state
+            # Anything still lying around is an answer to something else
+            self._reader.discard()
+            self.ser.write(batch)
+            try:
+                self._state = _parseState(self._readLines(4 * frames, keep=4))
+            except BaseException:
+                # Our copy has the batch in it, but we don't know how much of
+                # it the switcher actually did
+                self._state = None
+                raise
+            return self._state
+        finally:
+            self._lock.release()
+
+
+    def _abortBatch(self):
+        """Throw away a batch that's been started, for when something goes
+        wrong before finishBatch().  Our copy of the state already has the
+        queued commands in it, and they never went out, so forget it"""
+        self._batch = None
+        self._state = None
+        self._lock.release()
+
+
+    @_locked
     def muteAll(self):
         """Mutes all outputs"""
-        command = f'*{self.u}MA'
-        self._writeSerial(command)
+        if self._batch is not None:
+            self._writeSerial(self._cmdMuteAll)
+            self._state = 0
+            return
+
+        # Anything still lying around is an answer to something else
+        self._reader.discard()
+        self._writeSerial(self._cmdMuteAll)
+        # Read the status output that follows, so it isn't taken for the
+        # answer to the next command
+        self.readState()
 
 
+    @_locked
     def mute(self, ii, o):
         """Mute a specific input ii on output o"""
-        command = f'*{self.u}{ii:02d}M{o}'
-        self._writeSerial(command)
+        _checkCrosspoint(ii, o)
+        self._writeSerial(self._cmdMute[(ii, o)])
+        if self._state is not None:
+            self._state &= ~_bit(ii, o)
 
 
+    @_locked
     def connect(self, ii, o):
         """Connects a specific input ii to output o"""
-        command = f'*{self.u}{ii:02d}{o}'
-        self._writeSerial(command)
+        _checkCrosspoint(ii, o)
+        self._writeSerial(self._cmdConnect[(ii, o)])
+        if self._state is not None:
+            self._state |= _bit(ii, o)
 
 
+    @_locked
     def readState(self):
         """Read the status output from the SS 4.4.  After every change of state
         (i.e. mute or connect) the SS 4.4 will output a 4 line status output.
-        Parse this into a dictionary of lists"""
-        results = {}        # initialize dict
-
-        # read 4 lines of input until we see the newline.  Decode to UTF-8, and
-        # strip off the CR/NL at the end.
-        lines = []
-        for x in range(4):
-            lines.append(self.ser.read_until().decode('utf-8').strip())
-
-        # Output lines look like:
-        # S0L1,0,1,0,0
-        # S0L2,0,0,0,1
-        # S0L3,0,0,0,1
-        # S0L4,0,0,0,1
-        # Where S means status, 0 is the unit number, L1, L2, L3, L4 are the
-        # outputs, and then the next 4 0's and 1's represent which input is
-        # connected to the output.  We'll split on the comma's, and only
-        # include the 0's and 1's.
-        # This is a bit tricky.  I want to have a list of booleans (True/False)
-        # that corresponds to the index of the input, but lists in python start
-        # at 0.  So, I create a list that has a none in the zero'th position,
-        # then Trues and Falses based on inputs 1-4.
-        i = 1
-        for line in lines:
-            results[i] = [ None ] + [ j == '1' for j in line.split(',')[1:5] ]
-            i += 1
+        Parse this into an integer with a bit for each input/output
+        crosspoint, use isConnected() to test them"""
+        self._state = _parseState(self._readLines(4))
+        return self._state
 
-        return results
+
+    @_locked
+    def getState(self):
+        """Ask the SS 4.4 for its status, and return it parsed (see
+        readState)"""
+        # Anything still lying around is an answer to something else
+        self._reader.discard()
+        self._writeSerial(self._cmdStatus)
+        return self.readState()
 
 
+    @_locked
     def printState(self):
         """Print a simple string of 16 ones and zeros to indicate the state of
         the switcher"""
-        command = f'*{self.u}SL'
-        self._writeSerial(command)
-        state = self.readState()
-        for o in sorted(state):
-            inputs = state[o][1:]
-            for ii in inputs:
-                if ii:
-                    print('1', end='')
-                else:
-                    print('0', end='')
-        print()
+        state = self.getState()
+        # Output 1, input 1 is the lowest bit, and comes first
+        print(f'{state:016b}'[::-1])
 
 
+    def _queueSwitch(self, ii, o):
+        """Queue up connecting input ii to output o, and muting the others"""
+        # When we connect an input, we want to find what previous input was
+        # connected, and mute that one.  Find the inputs that are on that are
+        # NOT the input we were asked to connect.
+        stale = _otherInputs(self._state, ii, o)
+
+        self.connect(ii, o)
+        for i in stale:
+            self.mute(i, o)
+
+
+    @_locked
     def switchOutput(self, ii, o):
         """connect input ii to output o, muting any other active inputs on that
-        output.  Simulates pressing the button on the front panel."""
-        # Connect the input to the output
-        self.connect(ii, o)
+        output.  Simulates pressing the button on the front panel.  Can be
+        called inside a batch, see startBatch().  Raises ValueError if ii or
+        o isn't 1-4, or IOError if the switcher doesn't end up in the right
+        state"""
+        _checkCrosspoint(ii, o)
+        if self._batch is not None:
+            self._queueSwitch(ii, o)
+            return
+
+        # Send the connect and all the mutes as one batch.  connect() and
+        # mute() keep our copy of the state up to date, so we know exactly
+        # what the last status output should say and just compare it.  If
+        # it doesn't match, our copy was out of date (someone used the front
+        # panel?) or a command went missing, so go round once more from
+        # what the switcher just told us.
+        for attempt in range(2):
+            self.startBatch()
+            try:
+                self._queueSwitch(ii, o)
+            except BaseException:
+                self._abortBatch()
+                raise
+            expected = self._state
+            results = self.finishBatch()
+            if results == expected:
+                return
+
+        # Whatever on this output still isn't what we expected is an error
+        _check(results, expected, _outputMask(o))
+
+
+    @_locked
+    def program(self, plan):
+        """Switch a whole list of (input, output) pairs, as if switchOutput()
+        was called for each in turn.  The whole plan goes out in a single
+        write, and only the state at the end is checked.  Returns that
+        state, or raises IOError if it's not right"""
+        plan = list(plan)
+        for ii, o in plan:
+            _checkCrosspoint(ii, o)
+
+        self.startBatch()
+        try:
+            for ii, o in plan:
+                self._queueSwitch(ii, o)
+        except BaseException:
+            self._abortBatch()
+            raise
+        expected = self._state
+        results = self.finishBatch()
+
+        _check(results, expected)
+        return results
 
-        # After every change of state, the switcher prints the new status, read
-        # that.
-        results = self.readState()
 
-        # Verify it switched
-        if results[o][ii] != True:
-            print("Error, didn't connect input {i} to output {o}")
+    # Versions of the above for asyncio callers that want to share an SS44
+    # rather than open the port with AsyncSS44.  They run the blocking method
+    # in a worker thread, so the event loop keeps going while we wait on the
+    # serial port.
+
+    async def muteAllAsync(self):
+        """muteAll() without blocking the event loop"""
+        await asyncio.to_thread(self.muteAll)
+
+
+    async def readStateAsync(self):
+        """readState() without blocking the event loop"""
+        return await asyncio.to_thread(self.readState)
+
+
+    async def getStateAsync(self):
+        """getState() without blocking the event loop"""
+        return await asyncio.to_thread(self.getState)
 
-        # When we connect an input, we want to find what previous input was
-        # connected, and mute that one.  Go through the list, find the input
-        # that's true that's NOT the input we were asked to connect, and mute
-        # it.
-        for i in range(len(results[o])):
-            if i != ii and results[o][i] == True:
-                self.mute(i, o)
-                # We've changed the state, (by muting) so we'll get a status
-                # from the switcher.  Read it and make sure we're now off.
-                newstatus = self.readState()
-                if newstatus[o][i] != False:
-                    print("Error, didn't mute input {i} on output {o}")
+
+    async def switchOutputAsync(self, ii, o):
+        """switchOutput() without blocking the event loop"""
+        await asyncio.to_thread(self.switchOutput, ii, o)
+
+
+    async def programAsync(self, plan):
+        """program() without blocking the event loop"""
+        return await asyncio.to_thread(self.program, plan)
+
+
+
+class AsyncSS44:
+    """asyncio version of SS44.  Serial reads and writes yield to the event
+    loop while waiting on the port, so a single process can drive several
+    switchers (or do other work) concurrently.  Needs pyserial-asyncio-fast,
+    or failing that pyserial-asyncio.  Create one with AsyncSS44.open()"""
+
+
+    def __init__(self, reader, writer, unit=0, timeout=1):
+        """Wrap an already open asyncio serial reader/writer pair, and set the
+        unit number (defaults to 0)"""
+        self.reader = reader
+        self.writer = writer
+        self.u = unit
+        (self._cmdMuteAll, self._cmdStatus,
+         self._cmdConnect, self._cmdMute) = _commands(unit)
+        self.timeout = timeout
+        # Lines read so far of the status output we're waiting for.  They're
+        # kept here so a timeout doesn't lose them (see _readLines)
+        self._lines = []
+
+
+    @classmethod
+    async def open(cls, port='/dev/ttyUSB0', baud=9600, unit=0, timeout=1):
+        """Open the serial port and return an AsyncSS44 for it.  timeout is
+        how long to wait for a whole status output"""
+        # pyserial-asyncio does blocking I/O inside the event loop, so prefer
+        # the -fast fork when it's installed.
+        try:
+            from serial_asyncio_fast import open_serial_connection
+        except ImportError:
+            from serial_asyncio import open_serial_connection
+        reader, writer = await open_serial_connection(url=port, baudrate=baud)
+        return cls(reader, writer, unit, timeout)
+
+
+    async def close(self):
+        """Close the serial port"""
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+    async def _writeSerial(self, c):
+        """Write the command bytes to the serial port, waiting for it to
+        drain"""
+        self.writer.write(c)
+        await self.writer.drain()
+
+
+    async def _readLines(self, n):
+        """Read n lines from the serial port, as bytes.  Each line goes into
+        self._lines as soon as it's read, so if we're cancelled (by a
+        timeout) part way through, the next call carries on where this one
+        left off rather than getting out of step with the switcher"""
+        while len(self._lines) < n:
+            self._lines.append(await self.reader.readuntil(b'\n'))
+        lines = self._lines[:n]
+        del self._lines[:n]
+
+        return lines
+
+
+    async def muteAll(self):
+        """Mutes all outputs"""
+        await self._writeSerial(self._cmdMuteAll)
+        # Read the status output that follows, so it isn't taken for the
+        # answer to the next command
+        await self.readState()
+
+
+    async def mute(self, ii, o):
+        """Mute a specific input ii on output o"""
+        _checkCrosspoint(ii, o)
+        await self._writeSerial(self._cmdMute[(ii, o)])
+
+
+    async def connect(self, ii, o):
+        """Connects a specific input ii to output o"""
+        _checkCrosspoint(ii, o)
+        await self._writeSerial(self._cmdConnect[(ii, o)])
+
+
+    async def readState(self):
+        """Read the 4 line status output from the SS 4.4, and parse it into an
+        integer (see SS44.readState).  Raises serial.SerialTimeoutException
+        if it doesn't turn up in time"""
+        try:
+            lines = await asyncio.wait_for(self._readLines(4), self.timeout)
+        except asyncio.TimeoutError:
+            raise serial.SerialTimeoutException(
+                'timed out waiting for the status output from the switcher')
+        return _parseState(lines)
+
+
+    async def getState(self):
+        """Ask the SS 4.4 for its status, and return it parsed (see
+        readState)"""
+        await self._writeSerial(self._cmdStatus)
+        return await self.readState()
+
+
+    async def printState(self):
+        """Print a simple string of 16 ones and zeros to indicate the state of
+        the switcher"""
+        state = await self.getState()
+        print(f'{state:016b}'[::-1])
+
+
+    async def switchOutput(self, ii, o):
+        """connect input ii to output o, muting any other active inputs on that
+        output.  Simulates pressing the button on the front panel.  Raises
+        IOError if the switcher doesn't do it"""
+        await self.connect(ii, o)
+        results = await self.readState()
+
+        if not isConnected(results, ii, o):
+            raise IOError(f'failed to connect input {ii} to output {o}')
+
+        for i in _otherInputs(results, ii, o):
+            await self.mute(i, o)
+            newstatus = await self.readState()
+            if isConnected(newstatus, i, o):
+                raise IOError(f'failed to mute input {i} on output {o}')
 
 
 
@@ -128,30 +696,12 @@ if __name__ == '__main__':
     # Print the initial state
     ss44.printState()
 
-    # Excercize the outputs
-    print('Excercise output 1')
-    ss44.switchOutput(1, 1)
-    ss44.switchOutput(2, 1)
-    ss44.switchOutput(3, 1)
-    ss44.switchOutput(4, 1)
-
-    print('Excercise output 2')
-    ss44.switchOutput(1, 2)
-    ss44.switchOutput(2, 2)
-    ss44.switchOutput(3, 2)
-    ss44.switchOutput(4, 2)
-
-    print('Excercise output 3')
-    ss44.switchOutput(1, 3)
-    ss44.switchOutput(2, 3)
-    ss44.switchOutput(3, 3)
-    ss44.switchOutput(4, 3)
-
-    print('Excercise output 4')
-    ss44.switchOutput(1, 4)
-    ss44.switchOutput(2, 4)
-    ss44.switchOutput(3, 4)
-    ss44.switchOutput(4, 4)
+    # Excercize the outputs, 1 to 4 on each output in turn, all in one go
+    print('Excercise outputs 1-4')
+    try:
+        ss44.program([(ii, o) for o in (1, 2, 3, 4) for ii in (1, 2, 3, 4)])
+    except IOError as e:
+        print(f'Error, {e}')
 
     ss44.printState()
 
@@ -160,3 +710,5 @@ if __name__ == '__main__':
 
     print('Mute All')
     ss44.muteAll()
+
+    ss44.close()
@@ -0,0 +1,52 @@
+# cython: language_level=3
+"""Compiled version of the SS 4.4 status parser, SS44._parseState.  It does
+the same thing a byte at a time in C, for when the switcher is polled hard
+enough that parsing shows up.  SS44.py falls back to the pure Python version
+if this hasn't been built.  Build it with:
+
+    python3 setup.py build_ext --inplace
+"""
+
+
+def parse_state(lines):
+    """Parse the 4 status lines from the SS 4.4 into a single integer, with one
+    bit for each input/output crosspoint (see SS44._parseState).  Raises
+    IOError if they don't give the state of every output"""
+    cdef unsigned int state = 0
+    cdef unsigned int seen = 0
+    cdef const unsigned char[:] line
+    cdef Py_ssize_t n, p, q
+    cdef int k, bits
+
+    for l in lines:
+        line = l
+        n = line.shape[0]
+
+        # Look for S, the unit number, L, the output, then 4 of ,0 or ,1.
+        # Same as _LINE_RE, the first one that matches on the line wins.
+        for p in range(n):
+            if line[p] != ord('S'):
+                continue
+            q = p + 1
+            while q < n and ord('0') <= line[q] <= ord('9'):
+                q += 1
+            if q == p + 1 or q + 9 >= n:
+                continue
+            if (line[q] != ord('L') or
+                    not ord('1') <= line[q + 1] <= ord('4')):
+                continue
+            for k in range(4):
+                if (line[q + 2 + 2 * k] != ord(',') or
+                        not ord('0') <= line[q + 3 + 2 * k] <= ord('1')):
+                    break
+            else:
+                bits = ((line[q + 3] & 1) | (line[q + 5] & 1) << 1 |
+                        (line[q + 7] & 1) << 2 | (line[q + 9] & 1) << 3)
+                state |= bits << ((line[q + 1] - 0x31) * 4)
+                seen |= 1 << (line[q + 1] - 0x31)
+                break
+
+    if seen != 0xF:
+        raise IOError('incomplete status output from the switcher')
+
+    return state
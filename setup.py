@@ -0,0 +1,24 @@
+# Builds the optional compiled status parser, _ss44parse.pyx.  SS44.py works
+# without it, so without Cython, or if the build fails, only SS44.py gets
+# installed.
+#
+#   python3 setup.py build_ext --inplace
+
+from setuptools import setup
+
+try:
+    from Cython.Build import cythonize
+except ImportError:
+    ext_modules = []
+else:
+    ext_modules = cythonize('_ss44parse.pyx')
+    # cythonize() doesn't pass optional through, so set it afterwards
+    for ext in ext_modules:
+        ext.optional = True
+
+setup(
+    name='ss44',
+    py_modules=['SS44'],
+    install_requires=['pyserial'],
+    ext_modules=ext_modules,
+)
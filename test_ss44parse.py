@@ -0,0 +1,97 @@
+"""Check the pure Python status parser in SS44.py on known status outputs,
+and that the compiled one (_ss44parse.pyx) agrees with it, on good status
+outputs and on all sorts of garbage.  The compiled parser tests are skipped
+if the extension hasn't been built."""
+
+import random
+import unittest
+
+import SS44
+
+try:
+    import _ss44parse
+except ImportError:
+    _ss44parse = None
+
+
+# A known status output, and the crosspoints it says are connected
+_GOOD = [b'S0L1,0,1,0,0\r\n', b'S0L2,1,0,0,1\r\n',
+         b'S0L3,0,0,1,0\r\n', b'S0L4,1,1,1,1\r\n']
+_GOOD_POINTS = [(2, 1), (1, 2), (4, 2), (3, 3),
+                (1, 4), (2, 4), (3, 4), (4, 4)]
+
+# Output 4 got cut off
+_INCOMPLETE = [b'S0L1,0,1,0,0\r\n', b'S0L2,0,0,0,1\r\n', b'S0L3,0,0']
+
+
+def _parse(parser, lines):
+    """Run parser on lines, returning the state or the error message"""
+    try:
+        return parser(lines)
+    except IOError as e:
+        return f'IOError: {e}'
+
+
+def _frame(r):
+    """A status output, usually for outputs 1-4 in some order, sometimes with
+    lines that are mangled, missing or for an output that doesn't exist"""
+    outputs = [1, 2, 3, 4]
+    r.shuffle(outputs)
+    lines = []
+    for o in outputs:
+        if r.random() < 0.05:
+            o = r.randint(0, 5)
+        u = r.choice(['', '0', '7', '12', '120'])
+        line = (f'S{u}L{o},' + ','.join(r.choice('0001') for x in range(4)) +
+                '\r\n').encode('ascii')
+        if r.random() < 0.1:
+            noise = bytes(r.choice(b'S0123456789L,\r\nx')
+                          for x in range(r.randint(0, 4)))
+            line = noise + line[:r.randint(0, len(line))]
+        if r.random() < 0.02:
+            line = line.replace(b',', b'2', 1)
+        lines.append(line)
+    if r.random() < 0.05:
+        del lines[r.randrange(4)]
+    return lines
+
+
+class TestPythonParser(unittest.TestCase):
+
+    def test_good_frame(self):
+        state = SS44._pyParseState(_GOOD)
+        self.assertEqual(SS44.crosspoints(state), _GOOD_POINTS)
+        self.assertTrue(SS44.isConnected(state, 2, 1))
+        self.assertFalse(SS44.isConnected(state, 1, 1))
+
+    def test_any_order(self):
+        self.assertEqual(SS44._pyParseState(_GOOD[::-1]),
+                         SS44._pyParseState(_GOOD))
+
+    def test_incomplete_frame(self):
+        with self.assertRaises(IOError):
+            SS44._pyParseState(_INCOMPLETE)
+
+
+@unittest.skipIf(_ss44parse is None, '_ss44parse extension not built')
+class TestCompiledParser(unittest.TestCase):
+
+    def test_good_frame(self):
+        self.assertEqual(_ss44parse.parse_state(_GOOD),
+                         SS44._pyParseState(_GOOD))
+        self.assertEqual(SS44.crosspoints(_ss44parse.parse_state(_GOOD)),
+                         _GOOD_POINTS)
+
+    def test_incomplete_frame(self):
+        with self.assertRaises(IOError):
+            _ss44parse.parse_state(_INCOMPLETE)
+
+    def test_fuzz(self):
+        r = random.Random(44)
+        for x in range(20000):
+            lines = _frame(r)
+            self.assertEqual(_parse(_ss44parse.parse_state, lines),
+                             _parse(SS44._pyParseState, lines), lines)
+
+if __name__ == '__main__':
+    unittest.main()